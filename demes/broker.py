@@ -0,0 +1,250 @@
+import numpy as np
+import collections
+import copy
+import multiprocessing as mp
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+from multiprocessing.connection import Listener, Client, answer_challenge, deliver_challenge
+from demes import run_simulation, simulation_params, report
+from ensemble import FixationStats
+
+HEARTBEAT = 5
+TIMEOUT = 30
+RETRY = 60
+BACKLOG = 128
+
+"""
+Hands out (parameter point, replicate block) tasks to workers and collects their results
+
+Every message is a single (kind, worker, ...) tuple sent over its own connection:
+@request    ask for a task, answered with ("task", id, params, replicates), ("wait", seconds) or ("stop",)
+@heartbeat  report that a task is still running, answered with ("ok",) or ("cancel",) if it was re-queued
+@result     return the FixationStats of a finished task to merge into its point, answered with ("ok",)
+
+A message the coordinator fails to handle is logged and answered with ("error", description).
+
+A task that has not had a heartbeat for `timeout` seconds is assumed to belong to a dead worker and is re-queued.
+Each connection is authenticated and answered on its own thread, so a stalled or misbehaving client only
+loses its own message.
+"""
+class Coordinator:
+    def __init__(self, address, authkey, points, repeats, block, timeout=TIMEOUT):
+        self.listener = Listener(address, backlog=BACKLOG)
+        self.address = self.listener.address
+        self.authkey = authkey
+        self.points = points
+        self.timeout = timeout
+        self.tasks = [(i, min(block, repeats - start)) for i in range(len(points)) for start in range(0, repeats, block)]
+        self.pending = collections.deque(range(len(self.tasks)))
+        self.running = {}
+        self.done = set()
+        self.results = [FixationStats() for point in points]
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+
+    # answer workers until every task has a result, re-queueing tasks from dead workers in the background
+    def serve(self):
+        threading.Thread(target=self.reap_forever, daemon=True).start()
+        threading.Thread(target=self.accept_forever, daemon=True).start()
+        self.finished.wait()
+
+        # keep answering for a while so that waiting workers are told to stop rather than finding nobody there
+        time.sleep(2 * HEARTBEAT)
+        self.listener.close()
+        return self.results
+
+    # accept connections until serve closes the listener
+    def accept_forever(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.respond, args=(conn,), daemon=True).start()
+
+    # authenticate a connection and answer its message, logging anything that goes wrong to stderr
+    def respond(self, conn):
+        try:
+            deliver_challenge(conn, self.authkey)
+            answer_challenge(conn, self.authkey)
+        except Exception as e:
+            print("Dropped unauthenticated connection: {0!r}".format(e), file=sys.stderr)
+            conn.close()
+            return
+
+        try:
+            if not conn.poll(self.timeout):
+                print("Dropped connection that sent nothing for {0}s".format(self.timeout), file=sys.stderr)
+                return
+            try:
+                reply = self.handle(conn.recv())
+            except Exception as e:
+                traceback.print_exc()
+                reply = ("error", repr(e))
+            conn.send(reply)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            conn.close()
+
+    def handle(self, message):
+        kind, worker = message[0], message[1]
+        with self.lock:
+            if kind == "request":
+                if len(self.pending) == 0:
+                    return ("wait", HEARTBEAT) if len(self.running) > 0 else ("stop",)
+                task = self.pending.popleft()
+                self.running[task] = [worker, time.time()]
+                point, replicates = self.tasks[task]
+                return ("task", task, self.points[point], replicates)
+            elif kind == "heartbeat":
+                task = message[2]
+                if task in self.running and self.running[task][0] == worker:
+                    self.running[task][1] = time.time()
+                    return ("ok",)
+                return ("cancel",)
+            elif kind == "result":
+                # keep the first result for a task, even from a worker it was taken away from
+                task, result = message[2], message[3]
+                if task not in self.done:
+                    if not isinstance(result, FixationStats):
+                        raise TypeError("Result for task {0} is a {1}, not FixationStats".format(task, type(result).__name__))
+
+                    # merge into a copy so that a result that fails part way through leaves the point untouched
+                    point = self.tasks[task][0]
+                    merged = copy.deepcopy(self.results[point])
+                    merged.merge(result)
+                    self.results[point] = merged
+                    self.done.add(task)
+                    self.running.pop(task, None)
+                    if task in self.pending:
+                        self.pending.remove(task)
+                    if len(self.done) == len(self.tasks):
+                        self.finished.set()
+                return ("ok",)
+        raise ValueError("Unknown message kind {0!r}".format(kind))
+
+    # put any task without a recent heartbeat back at the front of the queue
+    def reap(self):
+        with self.lock:
+            now = time.time()
+            for task, (worker, beat) in list(self.running.items()):
+                if now - beat > self.timeout:
+                    del self.running[task]
+                    self.pending.appendleft(task)
+
+    def reap_forever(self):
+        while True:
+            time.sleep(HEARTBEAT)
+            self.reap()
+
+# send a single message to the coordinator and return its reply
+def send(address, authkey, message):
+    with Client(address, authkey=authkey) as conn:
+        conn.send(message)
+        return conn.recv()
+
+# send a message, retrying with backoff through network errors for up to `patience` seconds before giving up
+def send_retrying(address, authkey, message, patience=RETRY):
+    deadline, delay = time.time() + patience, 0.5
+    while True:
+        try:
+            return send(address, authkey, message)
+        except (EOFError, OSError):
+            if time.time() + delay > deadline:
+                raise
+            time.sleep(delay)
+            delay = min(2 * delay, HEARTBEAT)
+
+# keep telling the coordinator a task is alive until it finishes or the coordinator cancels it, riding out network errors
+def heartbeat(address, authkey, worker, task, finished, cancelled):
+    while not finished.wait(HEARTBEAT):
+        try:
+            if send(address, authkey, ("heartbeat", worker, task))[0] == "cancel":
+                cancelled.set()
+        except (EOFError, OSError):
+            continue
+
+# request and run tasks until the coordinator says stop or has been unreachable for RETRY seconds
+def work(address, authkey):
+    np.random.seed()
+    worker = "{0}-{1}".format(socket.gethostname(), os.getpid())
+    try:
+        while True:
+            reply = send_retrying(address, authkey, ("request", worker))
+            if reply[0] == "stop":
+                return
+            elif reply[0] == "wait":
+                time.sleep(reply[1])
+                continue
+            elif reply[0] == "error":
+                print("Coordinator could not hand out a task: {0}".format(reply[1]), file=sys.stderr)
+                time.sleep(HEARTBEAT)
+                continue
+
+            _, task, params, replicates = reply
+            finished, cancelled = threading.Event(), threading.Event()
+            threading.Thread(target=heartbeat, args=(address, authkey, worker, task, finished, cancelled), daemon=True).start()
+            stats = FixationStats()
+            for i in range(replicates):
+                if cancelled.is_set():
+                    break
+                stats.add(*run_simulation(params))
+            finished.set()
+
+            # a complete block is still worth sending after a cancel, the coordinator keeps whichever result comes first
+            if len(stats) == replicates:
+                reply = send_retrying(address, authkey, ("result", worker, task, stats))
+                if reply[0] == "error":
+                    print("Coordinator rejected result for task {0}: {1}".format(task, reply[1]), file=sys.stderr)
+    except (EOFError, OSError) as e:
+        print("Coordinator unreachable for {0}s, stopping: {1!r}".format(RETRY, e), file=sys.stderr)
+
+def main():
+    REPEATS, BLOCK = 100, 10
+    TOTAL = 10000
+    M_VALUES = [1, 2, 5, 10, 20, 50, 100]
+    s = 0.01
+    f = 10
+
+    # messages are unpickled, so nodes must share a secret key unless everything runs on this machine
+    authkey = os.environ.get("DESAI_AUTHKEY", "").encode()
+    if len(sys.argv) == 3 and sys.argv[1] == "local":
+        address = ("localhost", 0)
+        authkey = os.urandom(32)
+    elif len(authkey) == 0 and len(sys.argv) > 1 and sys.argv[1] in ["serve", "work"]:
+        print("USAGE: DESAI_AUTHKEY must be set to a shared secret in serve and work mode")
+        return
+    elif len(sys.argv) == 3 and sys.argv[1] == "serve":
+        address = ("", int(sys.argv[2]))
+    elif len(sys.argv) == 4 and sys.argv[1] == "work":
+        work((sys.argv[2], int(sys.argv[3])), authkey)
+        return
+    else:
+        print("USAGE: python broker.py serve PORT | work HOST PORT | local WORKERS")
+        return
+
+    start = time.time()
+    coordinator = Coordinator(address, authkey, [simulation_params(M, TOTAL // M, s, f) for M in M_VALUES], REPEATS, BLOCK)
+
+    # stand in for separate nodes with fresh worker processes on this machine that don't inherit the listener
+    workers = []
+    if sys.argv[1] == "local":
+        workers = [mp.get_context("spawn").Process(target=work, args=(coordinator.address, authkey)) for i in range(int(sys.argv[2]))]
+        for process in workers:
+            process.start()
+
+    results = coordinator.serve()
+    for M, stats in zip(M_VALUES, results):
+        print(*report(M, TOTAL // M, stats), sep=",")
+    print(time.time() - start)
+
+    for process in workers:
+        process.join()
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import numpy as np
 import sys
 import time
+from ensemble import FixationStats
+from trajectories import TrajectoryArchive
 
 """ A population split into M demes with members having either A or a alleles """
 class Population:
@@ -21,9 +23,11 @@ class Population:
             choice.count["a"] += 1
             choice.count["A"] -= 1
 
-    def evolve(self, params):
-        # evolve the population until an allele fixes
+    def evolve(self, params, writer=None):
+        # evolve the population until an allele fixes, optionally recording the 'a' counts of each deme
         while not self.fixed and not self.extinct:
+            if writer is not None and writer.wants(self.age):
+                writer.record(self.age, [deme.count["a"] for deme in self.demes])
             self.migrate()
 
             # reproduce each deme and if any are not fixed or not extinct then slip booleans
@@ -38,6 +42,10 @@ class Population:
             self.extinct = extinct
             self.age += 1
 
+        # always keep the generation where an allele fixed, even if it is off the sampling grid
+        if writer is not None:
+            writer.close(self.age, [deme.count["a"] for deme in self.demes])
+
     def migrate(self):
         # calculate the number of migrants
         n_migrant = round(self.m * self.N)
@@ -100,52 +108,63 @@ class Deme:
 
 def main():
     REPEATS = 100
+    SAMPLE, MAX_SAMPLES = 10, 1000
     s = 0.01
     f = 10
 
     start = time.time()
 
     # check if they didn't provide CLAs
-    if len(sys.argv) != 3:
-        print("USAGE: python demes.py M N")
+    if len(sys.argv) not in [3, 4]:
+        print("USAGE: python demes.py M N [ARCHIVE]")
         return
     M, N = int(sys.argv[1]), int(sys.argv[2])
-    averages = []
+    stats = FixationStats()
+
+    # optionally record the trajectories of every replicate to a memory-mapped archive
+    archive = TrajectoryArchive(sys.argv[3], REPEATS, M, MAX_SAMPLES, SAMPLE) if len(sys.argv) == 4 else None
 
     # run the same simulation REPEATS times
     for i in range(REPEATS):
-        averages.append(run_simulation({
-            "pop": {
-                "demes": M,
-                "deme_size": N,
-                "m": 0.01
-            },
-            "evolve": {
-                "selection": {
-                    "a": [f * s, 0],
-                    "A": [0, s]
-                },
-                "mu": 0,
-                "nu": 0,
-                "alpha": s,
-                "beta": 2 * s / f,
-            }
-        }))
-
-    # find the fraction of simulations in which 'a' fixed and the fixation times for those
-    fix_prob, avgtime = 0, 0
-    for t, fix in averages:
-        fix_prob += int(fix)
-        avgtime += t if fix else 0
-    avgtime /= fix_prob if fix_prob != 0 else 1
-    fix_prob /= len(averages)
-    print(M, N, fix_prob, round(avgtime), sep=",")
+        stats.add(*run_simulation(simulation_params(M, N, s, f), archive.writer(i) if archive is not None else None))
+
+    if archive is not None:
+        archive.flush()
+    print(*report(M, N, stats), sep=",")
     print(time.time() - start)
 
+# parameters for M demes of size N where 'a' is favoured by f * s in environment 0 and A by s in environment 1
+def simulation_params(M, N, s, f):
+    return {
+        "pop": {
+            "demes": M,
+            "deme_size": N,
+            "m": 0.01
+        },
+        "evolve": {
+            "selection": {
+                "a": [f * s, 0],
+                "A": [0, s]
+            },
+            "mu": 0,
+            "nu": 0,
+            "alpha": s,
+            "beta": 2 * s / f,
+        }
+    }
+
+# M, N, Pfix, mean Tfix, then the spread and quantiles of Tfix and the mean and median extinction time, nan when there are none
+def report(M, N, stats, quantiles=(0.1, 0.5, 0.9)):
+    times = [stats.fixation.mean, stats.fixation.std()] + [stats.fixation_times.quantile(q) for q in quantiles]
+    if stats.fixation.n == 0:
+        times = [np.nan] * len(times)
+    extinction = [stats.extinction.mean, stats.extinction_times.quantile(0.5)] if stats.extinction.n > 0 else [np.nan] * 2
+    return [M, N, stats.fix_prob()] + ["{0:.0f}".format(t) for t in times + extinction]
+
 # create new population, evolve until an allele fixes and return stats
-def run_simulation(params):
+def run_simulation(params, writer=None):
     pop = Population(params["pop"])
-    pop.evolve(params["evolve"])
+    pop.evolve(params["evolve"], writer)
     return pop.age, pop.fixed
 
 if __name__ == "__main__":
@@ -0,0 +1,125 @@
+import numpy as np
+import math
+
+""" Running count, mean, variance and range of a stream of values using Welford's algorithm """
+class Welford:
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    # combine the moments of another stream into this one (Chan et al.)
+    def merge(self, other):
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta ** 2 * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+"""
+A mergeable quantile sketch of non-negative values with relative accuracy (DDSketch)
+
+Values are counted in logarithmic buckets (gamma^(k-1), gamma^k] so any quantile is within `accuracy` of the
+true value, and the number of buckets only grows with the log of the range of values rather than their count.
+"""
+class QuantileSketch:
+    def __init__(self, accuracy=0.01):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.buckets = {}
+        self.zeros = 0
+        self.n = 0
+
+    def key(self, x):
+        return math.ceil(math.log(x, self.gamma))
+
+    # representative value of a bucket, within accuracy of everything counted in it
+    def value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, x):
+        if x <= 0:
+            self.zeros += 1
+        else:
+            key = self.key(x)
+            self.buckets[key] = self.buckets.get(key, 0) + 1
+        self.n += 1
+
+    def merge(self, other):
+        if other.accuracy != self.accuracy:
+            raise ValueError("Cannot merge sketches with accuracy {0} and {1}".format(self.accuracy, other.accuracy))
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zeros += other.zeros
+        self.n += other.n
+
+    def quantile(self, q):
+        if self.n == 0:
+            return math.nan
+        rank = q * (self.n - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                return self.value(key)
+        return self.value(max(self.buckets))
+
+    # counts of the sketched values in the given bins, as with np.histogram
+    def histogram(self, bins=10):
+        keys = sorted(self.buckets)
+        values = [self.value(key) for key in keys]
+        counts = [self.buckets[key] for key in keys]
+        if self.zeros > 0:
+            values, counts = [0.0] + values, [self.zeros] + counts
+        return np.histogram(values, bins=bins, weights=counts)
+
+""" Constant memory statistics of the (age, fixed) outcomes of many replicates at one parameter point """
+class FixationStats:
+    def __init__(self, accuracy=0.01):
+        self.fixation = Welford()
+        self.fixation_times = QuantileSketch(accuracy)
+        self.extinction = Welford()
+        self.extinction_times = QuantileSketch(accuracy)
+
+    # fold in the result of a single replicate
+    def add(self, age, fixed):
+        if fixed:
+            self.fixation.add(age)
+            self.fixation_times.add(age)
+        else:
+            self.extinction.add(age)
+            self.extinction_times.add(age)
+
+    def merge(self, other):
+        self.fixation.merge(other.fixation)
+        self.fixation_times.merge(other.fixation_times)
+        self.extinction.merge(other.extinction)
+        self.extinction_times.merge(other.extinction_times)
+
+    def __len__(self):
+        return self.fixation.n + self.extinction.n
+
+    def fix_prob(self):
+        return self.fixation.n / len(self) if len(self) > 0 else 0.0
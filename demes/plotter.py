@@ -1,5 +1,6 @@
 import matplotlib.pyplot as plt
 import numpy as np
+from trajectories import TrajectoryArchive
 
 titles = {
     "absfitness": "Fixation for varying absolute fitnesses",
@@ -48,6 +49,16 @@ def main():
         plt.ylabel("Fixation Probability")
         plt.show()
 
+# plot the mean 'a' frequency across demes for every replicate in a trajectory archive
+def plot_trajectories(path, N, replicates=None):
+    archive = TrajectoryArchive.open(path)
+    for i in range(len(archive)) if replicates is None else replicates:
+        plt.plot(archive.times(i), archive.trajectory(i).mean(axis=0) / N, color="black", alpha=0.1)
+    plt.xlabel("Time")
+    plt.ylabel("Allele Frequency")
+    plt.ylim((0, 1))
+    plt.show()
+
 def fix_from_M(M, a=0.001, b=0.0002):
     return 1 - (a*(1-b)*(M - 1) / ((1-a)*b))
 
@@ -0,0 +1,100 @@
+import numpy as np
+
+LENGTH, AGE, TRUNCATED = 0, 1, 2
+
+"""
+A memory-mapped archive of thinned 'a' allele count trajectories for many replicates
+
+The archive is three .npy files so that any reader can open them with np.load(mmap_mode="r"):
+@<path>.header.npy  int64 array holding the sampling interval and max_samples the archive was written with
+@<path>.counts.npy  uint32 array of shape (replicates, demes, max_samples)
+@<path>.index.npy   int64 array of shape (replicates, 3) holding the number of samples of each replicate, the age
+                    of its last sample and whether samples were dropped because its slot filled up
+
+Samples are taken every `sample` generations except the last, which is always the final generation of the
+replicate and so may be off the sampling grid. The last slot is kept free for it.
+
+Every replicate owns a fixed slot in the counts and index, so parallel workers can open the archive with mode "r+"
+and write their own replicates without any locking, calling flush once they have written all of them.
+"""
+class TrajectoryArchive:
+    def __init__(self, path, replicates, demes, max_samples, sample=100):
+        if max_samples < 2:
+            raise ValueError("max_samples must leave room for the final generation, got {0}".format(max_samples))
+        self.path = path
+        self.sample = sample
+        self.max_samples = max_samples
+        np.save(path + ".header.npy", np.array([sample, max_samples], dtype=np.int64))
+        self.counts = np.lib.format.open_memmap(path + ".counts.npy", mode="w+", dtype=np.uint32,
+            shape=(replicates, demes, max_samples))
+        self.index = np.lib.format.open_memmap(path + ".index.npy", mode="w+", dtype=np.int64,
+            shape=(replicates, 3))
+        self.flush()
+
+    # open an existing archive, "r" for zero-copy reading and "r+" for workers writing their own replicates
+    @classmethod
+    def open(cls, path, mode="r"):
+        archive = cls.__new__(cls)
+        archive.path = path
+        archive.sample, archive.max_samples = [int(x) for x in np.load(path + ".header.npy")]
+        archive.counts = np.load(path + ".counts.npy", mmap_mode=mode)
+        archive.index = np.load(path + ".index.npy", mmap_mode=mode)
+        return archive
+
+    def __len__(self):
+        return self.counts.shape[0]
+
+    # create a writer that records a single replicate into its slot
+    def writer(self, replicate):
+        return TrajectoryWriter(self, replicate)
+
+    # return a (demes, length) view of the recorded counts of a replicate without copying
+    def trajectory(self, replicate):
+        return self.counts[replicate, :, :self.index[replicate, LENGTH]]
+
+    # return the generations at which the samples of a replicate were taken
+    def times(self, replicate):
+        times = np.arange(self.index[replicate, LENGTH]) * self.sample
+        if len(times) > 0:
+            times[-1] = self.index[replicate, AGE]
+        return times
+
+    # whether on-grid samples of a replicate were dropped because its slot was full
+    def truncated(self, replicate):
+        return bool(self.index[replicate, TRUNCATED])
+
+    def flush(self):
+        self.counts.flush()
+        self.index.flush()
+
+""" Records every sample-th generation and the final generation of one replicate into its slot of a TrajectoryArchive """
+class TrajectoryWriter:
+    def __init__(self, archive, replicate):
+        self.archive = archive
+        self.replicate = replicate
+        self.length = 0
+        self.archive.index[replicate] = 0
+
+    # whether a generation is on the sampling grid, so callers can skip gathering counts that won't be stored
+    def wants(self, age):
+        return age % self.archive.sample == 0
+
+    # store the deme counts if this generation is sampled, flagging the replicate once its slot is full
+    def record(self, age, counts):
+        if not self.wants(age):
+            return
+        if self.length >= self.archive.max_samples - 1:
+            self.archive.index[self.replicate, TRUNCATED] = 1
+            return
+        self.write(age, counts)
+
+    # store the deme counts of the final generation, which always has room in the slot
+    def close(self, age, counts):
+        if self.length == 0 or self.archive.index[self.replicate, AGE] != age:
+            self.write(age, counts)
+
+    def write(self, age, counts):
+        self.archive.counts[self.replicate, :, self.length] = counts
+        self.length += 1
+        self.archive.index[self.replicate, LENGTH] = self.length
+        self.archive.index[self.replicate, AGE] = age
@@ -2,6 +2,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.colors as colours
 import copy
+import sys
 import time
 
 """ A population of individuals with genomes and mutations """
@@ -79,8 +80,8 @@ A mutation for a specific locus in a genome
 @count      array of counts across time
 """
 class Mutation:
-    def __init__(self, inception, locus, current=0, parent=None):
-        self.fitness = [1 + np.random.normal(0, 0.75) for x in range(ENVIRONMENTS)]
+    def __init__(self, inception, locus, current=0, parent=None, fitness=None):
+        self.fitness = [1 + np.random.normal(0, 0.75) for x in range(ENVIRONMENTS)] if fitness is None else fitness
         self.inception = inception
         self.locus = locus
         self.alive = True
@@ -103,6 +104,82 @@ class Mutation:
         print("Fitness: {0:+2.2f}, Inception: {1:4.0f}, Alive: {2:1b}, Current: {3:4.0f}, Parent: {4}, Locus: {5}".format(
             self.fitness, self.inception, self.alive, self.current, self.parent, self.locus))
 
+""" 
+A sexually reproducing population stored as an N x LOCI matrix of mutation ids, with -1 for an unmutated locus
+
+@genomes            mutation id at every locus of every member
+@fitness_table      fitness of each mutation in each environment, offset by one so row 0 is the unmutated locus
+@inception          generation each mutation was created
+@locus              locus of each mutation
+@parent             mutation each one replaced, -1 if the locus was unmutated
+@history            counts of every mutation after each generation
+"""
+class GenotypeMatrix:
+    def __init__(self, size, loci, recombination_rate=0.5):
+        self.N = size
+        self.loci = loci
+        self.recombination_rate = recombination_rate
+        self.genomes = np.full((size, loci), -1, dtype=int)
+        self.fitness_table = np.ones((1, ENVIRONMENTS))
+        self.inception = np.zeros(0, dtype=int)
+        self.locus = np.zeros(0, dtype=int)
+        self.parent = np.zeros(0, dtype=int)
+        self.history = []
+
+    # mean fitness across the loci of every member in the given environment
+    def fitnesses(self, environment):
+        return self.fitness_table[self.genomes + 1, environment].mean(axis=1)
+
+    # replace the whole population with children of parent pairs chosen with weights by fitness
+    def reproduce(self, environment):
+        weights = self.fitnesses(environment)
+        weights += (1 - min(weights))
+        parents = np.random.choice(self.N, (self.N, 2), True, np.divide(weights, np.sum(weights)))
+
+        # children start copying a random parent and switch parent at every crossover between neighbouring loci
+        crossovers = np.random.random((self.N, self.loci - 1)) < self.recombination_rate
+        switches = np.concatenate([np.random.randint(0, 2, (self.N, 1)), crossovers], axis=1)
+        mask = np.cumsum(switches, axis=1) % 2 == 0
+        self.genomes = np.where(mask, self.genomes[parents[:, 0]], self.genomes[parents[:, 1]])
+
+    # give every locus of every member a chance to mutate
+    def mutate(self, generation, mutation_rate):
+        members, loci = np.nonzero(np.random.random((self.N, self.loci)) < mutation_rate)
+        ids = len(self.inception) + np.arange(len(members))
+        self.fitness_table = np.concatenate([self.fitness_table, 1 + np.random.normal(0, 0.75, (len(members), ENVIRONMENTS))])
+        self.inception = np.concatenate([self.inception, np.full(len(members), generation)])
+        self.locus = np.concatenate([self.locus, loci])
+        self.parent = np.concatenate([self.parent, self.genomes[members, loci]])
+        self.genomes[members, loci] = ids
+
+    def time_step(self):
+        self.history.append(np.bincount(self.genomes.ravel() + 1, minlength=len(self.inception) + 1)[1:])
+
+    # convert the recorded history into Mutation instances for plot_mutation_evolution
+    def mutations(self):
+        counts = np.zeros((len(self.history), len(self.inception)), dtype=int)
+        for i in range(len(self.history)):
+            counts[i, :len(self.history[i])] = self.history[i]
+
+        final = counts[-1] if len(self.history) > 0 else np.zeros(len(self.inception), dtype=int)
+        mutations = []
+        for i in range(len(self.inception)):
+            alive = np.nonzero(counts[:, i])[0]
+            mutation = Mutation(self.inception[i], self.locus[i], final[i], self.parent[i] if self.parent[i] >= 0 else None,
+                list(self.fitness_table[i + 1]))
+            mutation.count = list(counts[self.inception[i]:alive[-1] + 1, i]) if len(alive) > 0 else [0]
+            mutation.alive = final[i] > 0
+            mutations.append(mutation)
+        return mutations
+
+""" Evolve a sexual population one whole generation at a time, each generation is POP_SIZE births of evolve_population """
+def evolve_sexual_population(pop, generations):
+    for i in range(generations):
+        environment = (i * pop.N // ENVIRONMENT_CHANGE) % ENVIRONMENTS
+        pop.reproduce(environment)
+        pop.mutate(i, mutation_rate)
+        pop.time_step()
+
 """ Evoluation a population instance through a specific amount of time, record the mutation that develop """
 def evolve_population(pop, time):
     environment = 1
@@ -139,7 +216,8 @@ def mutation_occurs(mutation_rate):
     return bool(np.random.choice([0, 1], 1, True, [1 - mutation_rate, mutation_rate]))
 
 """ Create a muller plot of the mutations that had adbunance of at least the cutoff at some time """
-def plot_mutation_evolution(mutations, time, colorscale=False, cutoff=0.5, lines=False, legend=True):
+def plot_mutation_evolution(mutations, time, colorscale=False, cutoff=0.5, lines=False, legend=True, sample=None):
+    sample = SAMPLE if sample is None else sample
     long_lived_mutations = [[] for x in range(LOCI)]
     for mutation in mutations:
         if max(mutation.count) > cutoff * POP_SIZE:
@@ -153,7 +231,7 @@ def plot_mutation_evolution(mutations, time, colorscale=False, cutoff=0.5, lines
     fitnesses = [[] for x in range(LOCI)]
     labels = [[] for x in range(LOCI)]
     for i in range(LOCI):
-        counts[i] = [(np.divide(mutation.count[0::SAMPLE], POP_SIZE)) for mutation in long_lived_mutations[i]]
+        counts[i] = [(np.divide(mutation.count[0::sample], POP_SIZE)) for mutation in long_lived_mutations[i]]
         fitnesses[i] = [[round(fitness, 2) for fitness in mutation.fitness] for mutation in long_lived_mutations[i]]
         labels[i] = [r"$s$:{0}, locus:{1}".format([round(fitness - 1, 2) for fitness in mutation.fitness], mutation.locus) for mutation in long_lived_mutations[i]]
 
@@ -170,7 +248,7 @@ def plot_mutation_evolution(mutations, time, colorscale=False, cutoff=0.5, lines
         for i in range(len(counts)):
             colours = [cm(1.*j / len(counts[i])) for j in range(len(counts[i]))]
             for j in range(len(counts[i])):
-                plt.plot(time[0::SAMPLE], counts[i][j], label=labels[i][j], color=colours[j], linewidth=1)
+                plt.plot(time[0::sample], counts[i][j], label=labels[i][j], color=colours[j], linewidth=1)
         if legend:
             leg = plt.legend(loc="upper left", ncol=2, fontsize='xx-small')
             for legobj in leg.legendHandles:
@@ -186,7 +264,7 @@ def plot_mutation_evolution(mutations, time, colorscale=False, cutoff=0.5, lines
         for i in range(LOCI):
             colours = [cm(1.*j / len(counts[i])) for j in range(len(counts[i]))]
             # np.random.shuffle(colours)
-            axes[i].stackplot(time[0::SAMPLE], counts[i], baseline="sym", labels=fitnesses[i], colors=colours)
+            axes[i].stackplot(time[0::sample], counts[i], baseline="sym", labels=fitnesses[i], colors=colours)
             if legend:
                 axes[i].legend(loc="upper left", ncol=2, fontsize='xx-small')
             if ENVIRONMENTS > 1:
@@ -203,7 +281,7 @@ def plot_mutation_evolution(mutations, time, colorscale=False, cutoff=0.5, lines
         f2 = plt.figure(2)
         colours = [cm(1.*j / len(counts[0])) for j in range(len(counts[0]))]
         # np.random.shuffle(colours)
-        plt.stackplot(time[0::SAMPLE], counts[0], baseline="sym", labels=fitnesses[0], colors=colours)
+        plt.stackplot(time[0::sample], counts[0], baseline="sym", labels=fitnesses[0], colors=colours)
         if legend:
             plt.legend(loc="upper left", ncol=2, fontsize='xx-small')
         plt.xlim((0, GENERATIONS))
@@ -226,6 +304,14 @@ mutations = []
 mutation_rate = (100 * LOCI) / GENERATIONS
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "sexual":
+        start = time.time()
+        pop = GenotypeMatrix(POP_SIZE, LOCI)
+        evolve_sexual_population(pop, GENERATIONS // POP_SIZE)
+        print("Elapsed {0}".format(time.time() - start))
+        plot_mutation_evolution(pop.mutations(), range(0, GENERATIONS, POP_SIZE), lines=True, cutoff=0.05, legend=False, sample=1)
+        return
+
     start = time.time()
     pop = Population(POP_SIZE, LOCI)
     evolve_population(pop, GENERATIONS)